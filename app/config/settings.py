@@ -36,9 +36,25 @@ class ModelSettings(LLMSettings):
         description="Device to run model on (cuda/cpu)"
     )
     batch_size: int = Field(
-        default=32,
+        default=256,
         description="Batch size for embedding generation"
     )
+    openai_embedding_model: str = Field(
+        default="text-embedding-3-small",
+        description="OpenAI embedding model used by the openAI backend"
+    )
+    onnx_path: Optional[str] = Field(
+        default_factory=lambda: os.getenv("ONNX_PATH"),
+        description="Path to an ONNX export of the model, used instead of PyTorch on cpu"
+    )
+    onnx_int8_path: Optional[str] = Field(
+        default_factory=lambda: os.getenv("ONNX_INT8_PATH"),
+        description="Path to an int8-quantized ONNX export, preferred over onnx_path on cpu"
+    )
+    compile_model: bool = Field(
+        default=False,
+        description="Compile the encoder with torch.compile when running on cuda"
+    )
     type_model: str = Field(
         default="sentence-transformer",
         description="Type of model (sentence-transformer, bert, etc)"
@@ -53,6 +69,10 @@ class DatabaseSettings(BaseModel):
     """Database connection settings."""
 
     service_url: str = Field(default_factory=lambda: os.getenv("SERVICE_URL"))
+    pool_size: int = Field(
+        default=8,
+        description="Connections kept open by the search connection pool"
+    )
 
 
 class VectorDBSettings(BaseModel):
@@ -60,6 +80,26 @@ class VectorDBSettings(BaseModel):
 
     table_name: str = "embeddings"
     embedding_dimensions: int = 768
+    hnsw_m: int = Field(
+        default=16,
+        description="Maximum connections per layer of the HNSW index"
+    )
+    hnsw_ef_construction: int = Field(
+        default=64,
+        description="Candidate list size used while building the HNSW index"
+    )
+    hnsw_ef_search: int = Field(
+        default=40,
+        description="Minimum candidate list size used while searching the HNSW index"
+    )
+    search_candidates_factor: int = Field(
+        default=4,
+        description="Nearest neighbours fetched per requested result before popularity reranking"
+    )
+    maintenance_work_mem: str = Field(
+        default="2GB",
+        description="maintenance_work_mem used while building the vector index"
+    )
     
 
 class Settings(BaseModel):
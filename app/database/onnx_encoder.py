@@ -0,0 +1,101 @@
+from typing import List, Optional
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoConfig, AutoTokenizer
+import numpy as np
+import sys
+
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
+
+
+class OnnxEncoder:
+    """A sentence encoder running an ONNX export of the embedding model on ONNX Runtime."""
+
+    def __init__(
+        self,
+        model_path: str,
+        file_name: Optional[str] = None,
+        max_seq_length: int = 384,
+        normalize: bool = True
+    ):
+        """
+        Load the tokenizer and the ONNX model exported to model_path.
+
+        Args:
+            model_path: Directory produced by `optimum-cli export onnx` or quantize_onnx_model.
+            file_name: ONNX file to load from model_path, if not the default model.onnx.
+            max_seq_length: Maximum number of tokens per text, as in the sentence-transformers config.
+            normalize: L2-normalize the pooled embeddings, mirroring the model's Normalize module.
+        """
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_path,
+            file_name=file_name,
+            provider="CPUExecutionProvider"
+        )
+        self.max_seq_length = max_seq_length
+        self.normalize = normalize
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        Generate mean-pooled embeddings for the given texts.
+
+        Accepts the same call shape as SentenceTransformer.encode so it can be used in its place;
+        extra keyword arguments are ignored.
+
+        Args:
+            texts: The input texts to generate embeddings for.
+            batch_size: Number of texts sent to the model per forward pass.
+            normalize_embeddings: L2-normalize the embeddings even if normalize is off.
+
+        Returns:
+            A (len(texts), hidden_size) array of embeddings.
+        """
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[i:i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            token_embeddings = np.asarray(self.model(**inputs).last_hidden_state)
+
+            mask = inputs["attention_mask"][..., np.newaxis].astype(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(pooled)
+
+        embeddings = np.concatenate(embeddings) if embeddings else np.empty((0, self.model.config.hidden_size))
+
+        if self.normalize or normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+
+        return embeddings
+
+
+def quantize_onnx_model(onnx_path: str, save_dir: str):
+    """
+    Apply dynamic int8 quantization to the Linear layers of an ONNX export.
+
+    Args:
+        onnx_path: Directory produced by `optimum-cli export onnx`.
+        save_dir: Directory to write the quantized model, its config and tokenizer to.
+    """
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=True)
+    quantizer = ORTQuantizer.from_pretrained(onnx_path)
+    quantizer.quantize(save_dir=save_dir, quantization_config=qconfig)
+
+    AutoConfig.from_pretrained(onnx_path).save_pretrained(save_dir)
+    AutoTokenizer.from_pretrained(onnx_path).save_pretrained(save_dir)
+
+
+if __name__ == "__main__":
+    quantize_onnx_model(sys.argv[1], sys.argv[2])
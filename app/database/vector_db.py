@@ -1,32 +1,88 @@
 from typing import List, Optional, Dict, Any, Tuple
+from functools import lru_cache
 from config.settings import get_settings
 from sentence_transformers import SentenceTransformer
 import pandas as pd
+import numpy as np
 import logging
 import torch
 import psycopg2
+from psycopg2.extras import execute_values
+from pgvector.psycopg2 import register_vector
 import datetime
+import weakref
+import csv
+import io
 import time
 import requests
 
+
+@lru_cache(maxsize=2)
+def _load_st(path: str, device: str, compile_model: bool) -> SentenceTransformer:
+    """Load a SentenceTransformer once per process so every VectorDB instance shares it."""
+    model = SentenceTransformer(path)
+    model.to(device)
+    assert next(model.parameters()).device.type == torch.device(device).type, \
+        f"Embedding model is not on the configured device {device}"
+    if device.startswith("cuda"):
+        model.half()
+        if compile_model:
+            eager_model = model[0].auto_model
+            try:
+                # No CUDA graphs: ingest batches vary in sequence length and run on a worker thread
+                model[0].auto_model = torch.compile(
+                    eager_model,
+                    mode="max-autotune-no-cudagraphs",
+                    dynamic=True,
+                    fullgraph=False
+                )
+                # Compilation is lazy, so run it once here to surface backend errors
+                with torch.inference_mode():
+                    model.encode(["warmup"], device=device, show_progress_bar=False)
+            except Exception as e:
+                logging.warning(f"torch.compile failed, falling back to eager mode: {str(e)}")
+                model[0].auto_model = eager_model
+    return model
+
+
+@lru_cache(maxsize=2)
+def _load_onnx(path: str, quantized: bool = False):
+    """Load an ONNX encoder once per process so every VectorDB instance shares it."""
+    # Imported here so optimum and onnxruntime are only needed when an ONNX model is configured
+    from database.onnx_encoder import OnnxEncoder, QUANTIZED_FILE_NAME
+
+    return OnnxEncoder(path, file_name=QUANTIZED_FILE_NAME if quantized else None)
+
+
 class VectorDB:
     """A class for managing vector operations and database interactions."""
 
     def __init__(self, model: str = "local"):
         """Initialize the VectorDB with settings and  model."""
         self.settings = get_settings()
-        self.embedding_model = self.settings.model.path_model
         self.vector_settings = self.settings.vector_db
         self.conn = psycopg2.connect(self.settings.database.service_url)
         self.cursor = self.conn.cursor()
+        register_vector(self.conn)
         
+        self._query_embedding_cache = lru_cache(maxsize=1024)(self._embed_query)
+        self._prepared_conns = weakref.WeakSet()
+
+        if model == "local" and self.settings.model.device == "cpu" and self.settings.model.onnx_int8_path:
+            self.model = _load_onnx(self.settings.model.onnx_int8_path, quantized=True)
+        elif model == "local" and self.settings.model.device == "cpu" and self.settings.model.onnx_path:
+            self.model = _load_onnx(self.settings.model.onnx_path)
+        elif model == "local":
+            self.model = _load_st(
+                self.settings.model.path_model,
+                self.settings.model.device,
+                self.settings.model.compile_model
+            )
+
         if model == "local":
-            if not hasattr(self, 'model'):
-                self.model = SentenceTransformer(self.settings.model.path_model)
-                self.model.to(self.settings.model.device)
-                
+            # Pay for CUDA context, cuBLAS handles and compilation here rather than on the first query
+            self.get_embeddings_local(["warmup"])
 
-        
     def get_embedding_hugging_face(self, text: str) -> List[float]:
         """
         Generate embedding for the given text using Hugging Face model.
@@ -80,26 +136,37 @@ class VectorDB:
         Returns:
             A list of floats representing the embedding.
         """
-        
-        
-        text = text.replace("\n", " ")
-        
+        return self.get_embeddings_local([text])[0].tolist()
+
+    def get_embeddings_local(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Generate embeddings for a list of texts in a single batched encode call.
+
+        Args:
+            texts: The input texts to generate embeddings for.
+            batch_size: Number of texts sent to the model per forward pass, defaults to ModelSettings.batch_size.
+
+        Returns:
+            A (len(texts), embedding_dimensions) array of L2-normalized embeddings.
+        """
         start_time = time.time()
-        
-        with torch.no_grad():
-            embedding = self.model.encode(
-                [text],
-                convert_to_tensor=True,
+
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                texts,
+                batch_size=batch_size or self.settings.model.batch_size,
+                convert_to_numpy=True,
                 device=self.settings.model.device,
-                batch_size=32,
-                show_progress_bar=False
+                show_progress_bar=False,
+                normalize_embeddings=True
             )
-            embedding = embedding[0].cpu().numpy().tolist()
-        
+
+        embeddings = embeddings.astype(np.float32, copy=False)
+
         elapsed_time = time.time() - start_time
-        logging.info(f"Embedding generated in {elapsed_time:.3f} seconds")
-        
-        return embedding
+        logging.info(f"{len(texts)} embeddings generated in {elapsed_time:.3f} seconds")
+
+        return embeddings
 
     def get_embedding_openAI(self, text: str) -> List[float]:
         """
@@ -116,7 +183,8 @@ class VectorDB:
         embedding = (
             self.openai_client.embeddings.create(
                 input=[text],
-                model=self.embedding_model,
+                model=self.settings.model.openai_embedding_model,
+                dimensions=self.vector_settings.embedding_dimensions,
             )
             .data[0]
             .embedding
@@ -125,6 +193,50 @@ class VectorDB:
         logging.info(f"Embedding generated in {elapsed_time:.3f} seconds")
         return embedding
 
+    def get_query_embedding(self, query_text: str, model: str = "local") -> List[float]:
+        """
+        Generate embedding for a search query, reusing it for repeated queries.
+
+        Args:
+            query_text: The query text to generate an embedding for.
+            model: Embedding backend (local, hugging-face or openAI).
+
+        Returns:
+            A list of floats representing the embedding.
+        """
+        return list(self._query_embedding_cache(query_text.strip(), model))
+
+    def get_query_embeddings(self, query_texts: List[str], model: str = "local") -> List[List[float]]:
+        """
+        Generate embeddings for several search queries, encoding each distinct query once.
+
+        Args:
+            query_texts: The query texts to generate embeddings for.
+            model: Embedding backend (local, hugging-face or openAI).
+
+        Returns:
+            A list of embeddings aligned with query_texts.
+        """
+        unique_texts = list(dict.fromkeys(text.strip() for text in query_texts))
+
+        if model == "local":
+            embeddings = dict(zip(unique_texts, self.get_embeddings_local(unique_texts).tolist()))
+        else:
+            embeddings = {text: self.get_query_embedding(text, model) for text in unique_texts}
+
+        return [embeddings[text.strip()] for text in query_texts]
+
+    def _embed_query(self, query_text: str, model: str) -> Tuple[float, ...]:
+        if model == "local":
+            embedding = self.get_embedding_local(query_text)
+        elif model == "hugging-face":
+            embedding = self.get_embedding_hugging_face(query_text)
+        elif model == "openAI":
+            embedding = self.get_embedding_openAI(query_text)
+        else:
+            raise ValueError(f"Unknown embedding model: {model}")
+        return tuple(embedding)
+
     def create_tables(self):
         """Create the embeddings table."""
         create_table_query = f"""
@@ -133,82 +245,170 @@ class VectorDB:
             title TEXT,
             metadata JSONB,
             contents TEXT,
-            embedding VECTOR({self.vector_settings.embedding_dimensions})
+            embedding VECTOR({self.vector_settings.embedding_dimensions}),
+            genres_arr TEXT[],
+            keywords_arr TEXT[]
         );
         """
         self.cursor.execute(create_table_query)
+
+        # Tables created before the array columns existed are migrated and backfilled from metadata
+        for column, key in (('genres_arr', 'genres'), ('keywords_arr', 'keywords')):
+            self.cursor.execute(f"""
+            ALTER TABLE {self.vector_settings.table_name} ADD COLUMN IF NOT EXISTS {column} TEXT[];
+            UPDATE {self.vector_settings.table_name}
+            SET {column} = ARRAY(
+                SELECT btrim(term)
+                FROM unnest(string_to_array(lower(metadata->>'{key}'), ',')) AS term
+                WHERE btrim(term) <> ''
+            )
+            WHERE {column} IS NULL;
+            """)
         self.conn.commit()
 
     def create_index(self):
-        """Create an index on the embedding column."""
+        """Create an index on the embedding column and GIN indexes on the genre and keyword arrays."""
         create_index_query = f"""
         CREATE INDEX IF NOT EXISTS idx_embedding
-        ON {self.vector_settings.table_name} USING ivfflat (embedding);
+        ON {self.vector_settings.table_name} USING hnsw (embedding vector_ip_ops)
+        WITH (m = {self.vector_settings.hnsw_m}, ef_construction = {self.vector_settings.hnsw_ef_construction});
         """
+        self.cursor.execute(
+            "SET maintenance_work_mem = %s;",
+            (self.vector_settings.maintenance_work_mem,)
+        )
         self.cursor.execute(create_index_query)
+        self.cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_genres_gin
+        ON {self.vector_settings.table_name} USING GIN (genres_arr);
+        CREATE INDEX IF NOT EXISTS idx_keywords_gin
+        ON {self.vector_settings.table_name} USING GIN (keywords_arr);
+        """)
+        self.cursor.execute("RESET maintenance_work_mem;")
         self.conn.commit()
 
-    def upsert(self, records_df: pd.DataFrame):
-        """Upsert records into the embeddings table."""
-        for _, row in records_df.iterrows():
-            upsert_query = f"""
-            INSERT INTO {self.vector_settings.table_name} (title, metadata, contents, embedding)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (id) DO UPDATE
-            SET title = EXCLUDED.title,
-                metadata = EXCLUDED.metadata,
-                contents = EXCLUDED.contents,
-                embedding = EXCLUDED.embedding;
-            """
-            self.cursor.execute(upsert_query, (row['title'],row['metadata'], row['contents'], row['embedding']))
+    def drop_index(self):
+        """Drop the index on the embedding column and the GIN indexes on the genre and keyword arrays."""
+        self.cursor.execute("DROP INDEX IF EXISTS idx_embedding, idx_genres_gin, idx_keywords_gin;")
         self.conn.commit()
 
+    def upsert(self, records_df: pd.DataFrame, page_size: int = 500, commit: bool = True):
+        """Upsert records into the embeddings table in multi-row batches."""
+        rows = list(zip(
+            records_df['title'],
+            records_df['metadata'],
+            records_df['contents'],
+            records_df['embedding'].map(self._to_vector),
+            records_df['genres_arr'],
+            records_df['keywords_arr']
+        ))
+        upsert_query = f"""
+        INSERT INTO {self.vector_settings.table_name} (title, metadata, contents, embedding, genres_arr, keywords_arr)
+        VALUES %s
+        ON CONFLICT (id) DO UPDATE
+        SET title = EXCLUDED.title,
+            metadata = EXCLUDED.metadata,
+            contents = EXCLUDED.contents,
+            embedding = EXCLUDED.embedding,
+            genres_arr = EXCLUDED.genres_arr,
+            keywords_arr = EXCLUDED.keywords_arr;
+        """
+        execute_values(self.cursor, upsert_query, rows, page_size=page_size)
+        if commit:
+            self.conn.commit()
+
+    def is_empty(self) -> bool:
+        """Return True if the embeddings table has no rows."""
+        self.cursor.execute(f"SELECT 1 FROM {self.vector_settings.table_name} LIMIT 1;")
+        return self.cursor.fetchone() is None
+
+    def bulk_copy(self, records_df: pd.DataFrame, commit: bool = True):
+        """Load records into an empty embeddings table with COPY FROM STDIN."""
+        buffer = io.StringIO()
+        # Quote every field: COPY reads an unquoted empty field as NULL, where upsert stores ''
+        writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+        for title, metadata, contents, embedding, genres, keywords in zip(
+            records_df['title'],
+            records_df['metadata'],
+            records_df['contents'],
+            records_df['embedding'],
+            records_df['genres_arr'],
+            records_df['keywords_arr']
+        ):
+            writer.writerow([
+                title,
+                metadata,
+                contents,
+                self._format_vector(embedding),
+                self._format_text_array(genres),
+                self._format_text_array(keywords)
+            ])
+        buffer.seek(0)
+
+        copy_query = f"""
+        COPY {self.vector_settings.table_name} (title, metadata, contents, embedding, genres_arr, keywords_arr)
+        FROM STDIN WITH (FORMAT csv)
+        """
+        self.cursor.copy_expert(copy_query, buffer)
+        if commit:
+            self.conn.commit()
+
+    @staticmethod
+    def _format_vector(embedding) -> str:
+        return '[' + ','.join(map(str, embedding)) + ']'
+
+    @staticmethod
+    def _format_text_array(values: List[str]) -> str:
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"') for value in values)
+        return '{' + ','.join(f'"{value}"' for value in escaped) + '}'
+
+    @staticmethod
+    def _to_vector(embedding) -> np.ndarray:
+        return np.asarray(embedding, dtype=np.float32)
+
     def _format_time_range(self, time_range: Tuple[int, int]) -> Tuple[str, str]:
         start_date = pd.to_datetime(f"{time_range[0]}-01-01").tz_localize('UTC').strftime('%Y-%m-%d')
         end_date = pd.to_datetime(f"{time_range[1]}-12-31").tz_localize('UTC').strftime('%Y-%m-%d')
         return start_date, end_date
     
-    def search(
-        self,
-        conn,
-        query_text: str,
-        metadata: Optional[Dict] = None,
-        limit: int = 16,
-        popularity_weight: float = 0.05,  
-        model: str= "local"
-    ) -> List[Tuple]:
-        """
-        Search for similar movies with popularity weighting and optional filters.
-        
-        Args:
-            conn: Active psycopg2 connection
-            query_text: Text to embed and compare
-            limit: Max results
-            metadata: Metadata filters (genres, keywords, original_language, time_range)
-            popularity_weight: Weight given to popularity in final score (0.0 to 1.0)
-        Returns:
-            List of result tuples (id, title, metadata, contents, similarity)
-        """
-        if model == "local":
-            query_embedding = self.get_embedding_local(query_text)
-        elif model == "hugging-face":
-            query_embedding = self.get_embedding_hugging_face(query_text)
-        elif model == "openAI":
-            query_embedding = self.get_embedding_openAI(query_text)    
-        
-        query_vector_str = '[' + ','.join(map(str, query_embedding)) + ']'
-        
-        # Modified SQL query to include popularity in scoring
-        sql_query = """
-        WITH weighted_results AS (
+    def _prepare_search(self, conn):
+        """Register the vector adapter and prepare the search statement once per connection."""
+        if conn in self._prepared_conns:
+            return
+
+        register_vector(conn)
+
+        prepare_query = f"""
+        PREPARE movie_search (vector, text, text[], text[], timestamp, timestamp, float8, int, int) AS
+        WITH candidates AS (
+            -- Nearest neighbours from the HNSW index, reranked by popularity below
             SELECT
                 id,
                 title,
                 metadata,
                 contents,
-                1 - (embedding <=> %s::vector) AS similarity,
+                embedding <#> $1 AS distance
+            FROM
+                {self.vector_settings.table_name}
+            WHERE
+                ($2::text IS NULL OR metadata->>'original_language' = $2)
+                AND ($3::text[] IS NULL OR genres_arr && $3)
+                AND ($4::text[] IS NULL OR keywords_arr && $4)
+                AND ($5::timestamp IS NULL OR (metadata->>'release_date')::timestamp BETWEEN $5 AND $6)
+            ORDER BY
+                embedding <#> $1
+            LIMIT $9
+        ),
+        weighted_results AS (
+            SELECT
+                id,
+                title,
+                metadata,
+                contents,
+                -- Embeddings are L2-normalized, so the inner product is the cosine similarity
+                -distance AS similarity,
                 COALESCE(CAST(metadata->>'popularity' AS FLOAT), 0) AS popularity,
-                -- Normalize popularity to 0-1 range within the filtered result set
+                -- Normalize popularity to 0-1 range within the candidate set
                 CASE 
                     WHEN MAX(CAST(metadata->>'popularity' AS FLOAT)) OVER() = MIN(CAST(metadata->>'popularity' AS FLOAT)) OVER()
                     THEN 0.5
@@ -216,40 +416,7 @@ class VectorDB:
                         NULLIF(MAX(CAST(metadata->>'popularity' AS FLOAT)) OVER() - MIN(CAST(metadata->>'popularity' AS FLOAT)) OVER(), 0)
                 END AS normalized_popularity
             FROM
-                embeddings
-            WHERE
-                TRUE
-        """
-        
-        params = [query_vector_str]
-        
-        # Add metadata filters
-        if metadata:
-            for key, value in metadata.items():
-                if value is None or value == '':
-                    continue
-                
-                if key in ('genres', 'keywords'):
-                    terms = [term.strip() for term in value.split(',')]
-                    if terms:
-                        conditions = []
-                        for term in terms:
-                            conditions.append(f"metadata->>'{key}' ILIKE %s")
-                            params.append(f"%{term}%")
-                        sql_query += f" AND ({' OR '.join(conditions)})"
-                
-                elif key == 'original_language':
-                    sql_query += " AND metadata->>'original_language' = %s"
-                    params.append(value)
-                
-                elif key == 'time_range':
-                    start_date, end_date = self._format_time_range(value)
-                    print(start_date, end_date)
-                    sql_query += " AND (metadata->>'release_date')::timestamp BETWEEN %s AND %s"
-                    params.extend([start_date, end_date])
-        
-        # Close the CTE and add the final scoring and ordering
-        sql_query += """
+                candidates
         )
         SELECT
             id,
@@ -258,18 +425,109 @@ class VectorDB:
             contents,
             similarity,
             -- Calculate final score combining similarity and normalized popularity
-            (similarity * (1 - %s) + normalized_popularity * %s) as final_score
+            (similarity * (1 - $7) + normalized_popularity * $7) as final_score
         FROM
             weighted_results
         ORDER BY
             final_score DESC
-        LIMIT %s
+        LIMIT $8
         """
+        with conn.cursor() as cur:
+            cur.execute(prepare_query)
+        self._prepared_conns.add(conn)
+
+    @staticmethod
+    def split_terms(value: str) -> List[str]:
+        """Split a comma-separated genre or keyword string into normalized terms."""
+        return [term.strip().lower() for term in value.split(',') if term.strip()]
+
+    def search(
+        self,
+        conn,
+        query_text: str,
+        metadata: Optional[Dict] = None,
+        limit: int = 16,
+        popularity_weight: float = 0.05,  
+        model: str= "local"
+    ) -> List[Tuple]:
+        """
+        Search for similar movies with popularity weighting and optional filters.
         
-        params.extend([popularity_weight, popularity_weight, limit])
-        
+        Args:
+            conn: Active psycopg2 connection
+            query_text: Text to embed and compare
+            limit: Max results
+            metadata: Metadata filters (genres, keywords, original_language, time_range)
+            popularity_weight: Weight given to popularity in final score (0.0 to 1.0)
+        Returns:
+            List of result tuples (id, title, metadata, contents, similarity)
+        """
+        return self.search_with_embedding(
+            conn,
+            self.get_query_embedding(query_text, model),
+            metadata=metadata,
+            limit=limit,
+            popularity_weight=popularity_weight
+        )
+
+    def search_with_embedding(
+        self,
+        conn,
+        embedding: List[float],
+        metadata: Optional[Dict] = None,
+        limit: int = 16,
+        popularity_weight: float = 0.05
+    ) -> List[Tuple]:
+        """
+        Search for similar movies using a precomputed query embedding.
+
+        Args:
+            conn: Active psycopg2 connection
+            embedding: Query embedding to compare against
+            limit: Max results
+            metadata: Metadata filters (genres, keywords, original_language, time_range)
+            popularity_weight: Weight given to popularity in final score (0.0 to 1.0)
+        Returns:
+            List of result tuples (id, title, metadata, contents, similarity)
+        """
+        query_embedding = self._to_vector(embedding)
+        # Not in place: _to_vector returns the caller's array unchanged when it is already float32
+        query_embedding = query_embedding / max(np.linalg.norm(query_embedding), 1e-12)
+
+        metadata = {
+            key: value for key, value in (metadata or {}).items()
+            if value is not None and value != ''
+        }
+
+        candidates = limit * self.vector_settings.search_candidates_factor
+        # HNSW returns at most ef_search rows, so it must cover the candidate set
+        ef_search = min(max(self.vector_settings.hnsw_ef_search, candidates), 1000)
+
+        genres = self.split_terms(metadata.get('genres', '')) or None
+        keywords = self.split_terms(metadata.get('keywords', '')) or None
+        start_date, end_date = (
+            self._format_time_range(metadata['time_range'])
+            if 'time_range' in metadata else (None, None)
+        )
+
+        params = [
+            query_embedding,
+            metadata.get('original_language'),
+            genres,
+            keywords,
+            start_date,
+            end_date,
+            popularity_weight,
+            limit,
+            candidates
+        ]
+
+        self._prepare_search(conn)
         with conn.cursor() as cur:
-            cur.execute(sql_query, params)
+            cur.execute("SET LOCAL hnsw.ef_search = %s;", (ef_search,))
+            # Filters run after the index scan; keep scanning until enough rows pass them (pgvector >= 0.8)
+            cur.execute("SET LOCAL hnsw.iterative_scan = relaxed_order;")
+            cur.execute("EXECUTE movie_search (%s, %s, %s, %s, %s, %s, %s, %s, %s);", params)
             results = cur.fetchall()
         
-        return results
\ No newline at end of file
+        return results
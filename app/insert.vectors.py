@@ -4,6 +4,16 @@ from datetime import datetime, timezone
 import logging
 import json
 import ast
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CSV_COLUMNS = [
+    'id', 'title', 'overview', 'genres', 'keywords', 'popularity', 'release_date', 'poster_path',
+    'production_companies', 'production_countries', 'original_language'
+]
+# Read everything as text so one malformed cell drops its row in clean_chunk instead of failing the load
+CSV_DTYPES = {column: 'object' for column in CSV_COLUMNS}
 
 
 class MovieVectorDB:
@@ -13,107 +23,165 @@ class MovieVectorDB:
         self.vec_db = VectorDB()
         self.logger = logging.getLogger(__name__)
         
-    def load_and_clean_data(self):
-        """Load and clean the movie dataset."""
+    def clean_chunk(self, df):
+        """Filter a chunk of the movie dataset down to usable rows."""
+        df = df.assign(
+            id=df['id'].str.strip(),
+            popularity=pd.to_numeric(df['popularity'], errors='coerce')
+        )
+
+        mask = df['id'].str.fullmatch(r'\d+', na=False)
+        mask &= df['popularity'] > 5
+        # .str.len() is NaN for missing and non-string values, so this also drops them
+        for column in ('overview', 'genres', 'keywords'):
+            mask &= df[column].str.len() > 0
+
+        release_year = pd.to_datetime(df['release_date'], errors='coerce').dt.year
+        mask &= release_year.between(1900, 2025)
+
+        return df[mask].drop_duplicates(subset=['id'])
+
+    def iter_clean_chunks(self, chunksize=50_000):
+        """Stream the movie dataset in chunks, yielding each chunk after cleaning."""
         try:
-            df = pd.read_csv(self.csv_path, sep=",")
-            
-            df = df.dropna(subset=['overview'])
-            df = df[df['overview'].apply(lambda x: isinstance(x, str))]
-            df = df[df['overview'].str.len() > 0]
-
-            df = df.dropna(subset=['genres'])
-            df = df[df['genres'].apply(lambda x: isinstance(x, str))]
-            df = df[df['genres'].str.len() > 0]
-
-            df = df.dropna(subset=['keywords'])
-            df = df[df['keywords'].apply(lambda x: isinstance(x, str))]
-            df = df[df['keywords'].str.len() > 0]
+            seen_ids = set()
+            for chunk in pd.read_csv(
+                self.csv_path,
+                sep=",",
+                chunksize=chunksize,
+                usecols=CSV_COLUMNS,
+                dtype=CSV_DTYPES
+            ):
+                df = self.clean_chunk(chunk)
+                df = df[~df['id'].isin(seen_ids)]
+                seen_ids.update(df['id'])
+                yield df
 
-            df = df[df['popularity'] > 5]
-
-            df = df.drop_duplicates(subset=['id'])
-
-            df = df[(pd.to_datetime(df['release_date']).dt.year >= 1900)]
-            df = df[(pd.to_datetime(df['release_date']).dt.year <= 2025)]
-
-            self.logger.info(f"Loaded dataset with {df.shape[0]} rows and {df.shape[1]} columns")
-
-            return df
-        
         except Exception as e:
             self.logger.error(f"Error loading data: {str(e)}")
             raise
+
+    def load_and_clean_data(self):
+        """Load and clean the movie dataset."""
+        df = pd.concat(self.iter_clean_chunks(), ignore_index=True)
+        self.logger.info(f"Loaded dataset with {df.shape[0]} rows and {df.shape[1]} columns")
+        return df
             
-    def prepare_record(self, row):
-        """Transform a row into the format expected by pgvector."""
+    def prepare_records(self, batch):
+        """Transform a batch of rows into the format expected by pgvector."""
         try:
-            release_date = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-            if pd.notna(row['release_date']):
-                try:
-                    release_date = pd.to_datetime(row['release_date']).tz_localize('UTC').strftime('%Y-%m-%d')
-                except (ValueError, TypeError) as e:
-                    self.logger.warning(f"Invalid date format for movie: {row.get('title', 'Unknown')}, using current time")
-            
-            title = str(row.get('title', '')).strip()
-            
-            metadata = {
-                "movie_id": str(row.get('id', '')).strip(),
-                "genres": str(row.get('genres', '')),
-                "popularity": row.get('popularity', 0.0),
-                "release_date": release_date,
-                "poster_path": str(row.get('poster_path', '')).strip(),
-                "production_companies": str(row.get('production_companies', '')),
-                "production_countries": str(row.get('production_countries', '')),
-                "original_language": str(row.get('original_language', '')).strip(),
-                "keywords": str(row.get('keywords', '')),
-            }
-
-            contents = str(row.get('overview', '')).strip()
-            embedding = self.vec_db.get_embedding_local(contents)
-
-            return {
-                "metadata": json.dumps(metadata),
-                "title":title,
-                "contents": contents,
-                "embedding": embedding
-            }
+            today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+            release_dates = (
+                pd.to_datetime(batch['release_date'], errors='coerce')
+                .dt.tz_localize('UTC')
+                .dt.strftime('%Y-%m-%d')
+            )
+            invalid_dates = release_dates.isna() & batch['release_date'].notna()
+            if invalid_dates.any():
+                self.logger.warning(f"Invalid date format for {invalid_dates.sum()} movies, using current time")
+            release_dates = release_dates.fillna(today)
+
+            metadata = pd.DataFrame({
+                "movie_id": batch['id'].fillna('').astype(str).str.strip(),
+                "genres": batch['genres'].fillna('').astype(str),
+                "popularity": batch['popularity'],
+                "release_date": release_dates,
+                "poster_path": batch['poster_path'].fillna('').astype(str).str.strip(),
+                "production_companies": batch['production_companies'].fillna('').astype(str),
+                "production_countries": batch['production_countries'].fillna('').astype(str),
+                "original_language": batch['original_language'].fillna('').astype(str).str.strip(),
+                "keywords": batch['keywords'].fillna('').astype(str),
+            })
+
+            return pd.DataFrame({
+                "metadata": [json.dumps(record) for record in metadata.to_dict('records')],
+                "title": batch['title'].fillna('').astype(str).str.strip().tolist(),
+                "contents": batch['overview'].fillna('').astype(str).str.strip().tolist(),
+                "genres_arr": batch['genres'].fillna('').astype(str).map(self.vec_db.split_terms).tolist(),
+                "keywords_arr": batch['keywords'].fillna('').astype(str).map(self.vec_db.split_terms).tolist(),
+            })
         except Exception as e:
-            self.logger.error(f"Error preparing record: {str(e)}")
+            self.logger.error(f"Error preparing records: {str(e)}")
             raise
             
     def process_batch(self, df, batch_size=1000):
         """Process records in batches to manage memory usage."""
         records = []
         for i in range(0, len(df), batch_size):
-            batch = df.iloc[i:i + batch_size]
-            batch_records = []
-            for _, row in batch.iterrows():
-                try:
-                    record = self.prepare_record(row)
-                    batch_records.append(record)
-                except Exception as e:
-                    self.logger.error(f"Error processing row: {str(e)}")
-                    continue
-            records.extend(batch_records)
+            batch_records = self.prepare_records(df.iloc[i:i + batch_size])
+            batch_records['embedding'] = list(self.vec_db.get_embeddings_local(batch_records['contents'].tolist()))
+            records.append(batch_records)
             self.logger.info(f"Processed batch {i//batch_size + 1} ({(len(df)//1000) -(i//batch_size + 1) } left)")
-        return pd.DataFrame(records)
+        if not records:
+            return pd.DataFrame(columns=['metadata', 'title', 'contents', 'genres_arr', 'keywords_arr', 'embedding'])
+        return pd.concat(records, ignore_index=True)
     
 
             
             
+    @staticmethod
+    def _put_records(records_queue, records_df, stop):
+        """Put records on the queue, giving up once the consumer has stopped."""
+        while not stop.is_set():
+            try:
+                records_queue.put(records_df, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _produce_records(self, records_queue, stop):
+        """Clean and embed the dataset chunk by chunk, handing records to the insert stage."""
+        try:
+            for chunk in self.iter_clean_chunks():
+                if stop.is_set():
+                    return
+                self._put_records(records_queue, self.process_batch(chunk), stop)
+        finally:
+            self._put_records(records_queue, None, stop)
+
+    def _consume_records(self, records_queue, stop, initial_load):
+        """Write embedded records to the database until the producer is done."""
+        try:
+            while (records_df := records_queue.get()) is not None:
+                # setup_database commits once every chunk is written
+                if initial_load:
+                    self.vec_db.bulk_copy(records_df, commit=False)
+                else:
+                    self.vec_db.upsert(records_df, commit=False)
+        except Exception:
+            stop.set()
+            raise
+
     def setup_database(self):
         """Set up the vector database with movie data."""
         try:
             
-            records_df = self.load_and_clean_data()
-            
-            records_df = self.process_batch(records_df)
-
             self.vec_db.create_tables()
-            self.vec_db.create_index()
 
-            self.vec_db.upsert(records_df)
+            # Indexes can survive an empty table (a rolled-back load or an old ivfflat index), so always drop them
+            initial_load = self.vec_db.is_empty()
+            self.vec_db.drop_index()
+
+            try:
+                # Embed the next chunk while the previous one is being written to the database
+                records_queue = queue.Queue(maxsize=4)
+                stop = threading.Event()
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    futures = [
+                        executor.submit(self._produce_records, records_queue, stop),
+                        executor.submit(self._consume_records, records_queue, stop, initial_load)
+                    ]
+                    for future in futures:
+                        future.result()
+
+                self.vec_db.conn.commit()
+            except Exception:
+                # Leave the table as it was rather than half-loaded
+                self.vec_db.conn.rollback()
+                raise
+            finally:
+                self.vec_db.create_index()
+
             self.logger.info("Successfully inserted data into vector db")
             
             return True
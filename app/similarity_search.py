@@ -1,21 +1,28 @@
 from typing import Dict, Optional
-import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 import logging
+from config.settings import get_settings
 from database.vector_db import VectorDB
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Search:
-    def __init__(self):
-        self.conn = psycopg2.connect(
+    def __init__(self, model="hugging-face"):
+        # minconn == maxconn: psycopg2 closes returned connections beyond minconn, losing their prepared statements
+        pool_size = get_settings().database.pool_size
+        self.pool = ThreadedConnectionPool(
+            pool_size,
+            pool_size,
             dbname="postgres",
             user="postgres",
             password="123",
             host="localhost",
             port="5432"
             )
-        self.vector_db = VectorDB(model="hugging-face")
+        # Backend loaded by VectorDB; search_movies_batch uses it by default
+        self.model = model
+        self.vector_db = VectorDB(model=model)
 
     def normalize_metadata(self, metadata):
         """Normalize metadata input formats"""
@@ -67,6 +74,17 @@ class Search:
                 
         return normalized
     
+    def _prepare_metadata(self, metadata):
+        """Normalize metadata and validate the time range."""
+        # Normalize metadata before processing
+        normalized_metadata = self.normalize_metadata(metadata or {})
+        
+        # Ensure time_range is a tuple
+        if "time_range" in normalized_metadata and not isinstance(normalized_metadata["time_range"], tuple):
+            raise ValueError("time_range must be a tuple")
+        
+        return normalized_metadata
+    
     def search_movies(
     self,
     query,
@@ -79,23 +97,62 @@ class Search:
             raise ValueError("Query cannot be empty")
             
         try:
-            # Normalize metadata before processing
-            normalized_metadata = self.normalize_metadata(metadata or {})
-            
-            # Ensure time_range is a tuple
-            if "time_range" in normalized_metadata and not isinstance(normalized_metadata["time_range"], tuple):
-                raise ValueError("time_range must be a tuple")
+            normalized_metadata = self._prepare_metadata(metadata)
             
             logger.info(f"Searching with query: {query}, metadata: {normalized_metadata}")
             
-            return self.vector_db.search(
-                conn=self.conn,
-                query_text=query,
-                metadata=normalized_metadata,
-                limit=limit,
-                popularity_weight=popularity_weight,
-                model=model
-            )
+            conn = self.pool.getconn()
+            try:
+                return self.vector_db.search(
+                    conn=conn,
+                    query_text=query,
+                    metadata=normalized_metadata,
+                    limit=limit,
+                    popularity_weight=popularity_weight,
+                    model=model
+                )
+            finally:
+                self.pool.putconn(conn)
+                    
+        except Exception as e:
+            logger.error(f"Search failed: {str(e)}")
+            raise ValueError(f"Search failed: {str(e)}")
+    
+    def search_movies_batch(
+    self,
+    queries,
+    limit=16,
+    popularity_weight=0.05,
+    model=None
+):
+        """Run several searches, embedding all distinct queries in one batch.
+
+        Each query is a dict with a "query" text and optional "metadata" filters.
+        model defaults to the backend this Search was built with.
+        """
+        try:
+            texts = [query.get("query") for query in queries]
+            if any(not isinstance(text, str) or not text.strip() for text in texts):
+                raise ValueError("Query cannot be empty")
+            
+            embeddings = self.vector_db.get_query_embeddings(texts, model=model or self.model)
+            
+            logger.info(f"Searching with {len(queries)} queries")
+            
+            conn = self.pool.getconn()
+            try:
+                return [
+                    self.vector_db.search_with_embedding(
+                        conn=conn,
+                        embedding=embedding,
+                        metadata=self._prepare_metadata(query.get("metadata")),
+                        limit=limit,
+                        popularity_weight=popularity_weight
+                    )
+                    for query, embedding in zip(queries, embeddings)
+                ]
+            finally:
+                self.pool.putconn(conn)
                     
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")